@@ -3,11 +3,16 @@ Aplicação Flask - Synapse
 API REST e servidor web
 """
 
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, render_template, request, jsonify, stream_with_context
 from flask_cors import CORS
 from dotenv import load_dotenv
+from typing import Optional
+import itertools
+import json
+import msgpack
 import os
 import sys
+import threading
 
 # Adiciona src ao path
 sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
@@ -24,21 +29,90 @@ app = Flask(__name__)
 CORS(app)
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev-secret-key')
 
+# Limite de resultados por busca
+MAX_TOP_K = 100
+
+# Limite de anotações por resposta em streaming
+MAX_STREAM_LIMIT = 10000
+
 # Inicializa serviços (lazy loading)
 _synapse = None
+_synapse_lock = threading.Lock()
+
+
+class SynapseUnavailableError(Exception):
+    """Synapse ainda não pôde ser inicializado (bancos ou modelo indisponíveis)"""
+
 
 def get_synapse() -> SynapseCore:
     """Retorna instância singleton do Synapse"""
     global _synapse
-    if _synapse is None:
-        print("🚀 Inicializando Synapse...")
-        neo4j = get_neo4j_service()
-        chroma = get_chroma_service()
-        _synapse = SynapseCore(neo4j, chroma)
-        print("✅ Synapse inicializado!")
+    if _synapse is not None:
+        return _synapse
+    
+    # Uma única thread inicializa; as demais esperam e reaproveitam o resultado
+    with _synapse_lock:
+        if _synapse is None:
+            print("🚀 Inicializando Synapse...")
+            neo4j = None
+            try:
+                neo4j = get_neo4j_service()
+                chroma = get_chroma_service()
+                synapse = SynapseCore(neo4j, chroma)
+                synapse.warmup()
+            except Exception as e:
+                # Não deixa o driver e suas conexões abertos a cada nova tentativa
+                if neo4j is not None:
+                    neo4j.close()
+                raise SynapseUnavailableError(str(e)) from e
+            _synapse = synapse
+            print("✅ Synapse inicializado!")
     return _synapse
 
 
+def _unavailable_response():
+    """Resposta 503 enquanto o Synapse não está inicializado"""
+    return jsonify({"error": "Serviço indisponível, tente novamente em instantes"}), 503
+
+
+# Inicializa na importação para que a primeira requisição não pague o
+# carregamento do modelo; em caso de falha, tenta de novo na próxima chamada
+try:
+    get_synapse()
+except Exception as e:
+    print(f"⚠️  Synapse não inicializado na importação: {e}")
+
+
+def _validate_note_payload(data) -> Optional[str]:
+    """Retorna a mensagem de erro do corpo de criação de anotação, ou None se válido"""
+    if not isinstance(data, dict):
+        return "Corpo JSON inválido"
+    title = data.get('title')
+    content = data.get('content')
+    if not isinstance(title, str) or not isinstance(content, str) \
+            or not title.strip() or not content.strip():
+        return "Título e conteúdo são obrigatórios e devem ser texto"
+    tags = data.get('tags', [])
+    if not isinstance(tags, list) or not all(isinstance(tag, str) for tag in tags):
+        return "Tags devem ser uma lista de textos"
+    return None
+
+
+def _validate_search_payload(data) -> Optional[str]:
+    """Retorna a mensagem de erro do corpo de busca, ou None se válido"""
+    if not isinstance(data, dict):
+        return "Corpo JSON inválido"
+    query = data.get('query')
+    if not isinstance(query, str) or not query.strip():
+        return "Query é obrigatória e deve ser texto"
+    top_k = data.get('top_k', 5)
+    # bool é subclasse de int no Python
+    if not isinstance(top_k, int) or isinstance(top_k, bool) \
+            or not 1 <= top_k <= MAX_TOP_K:
+        return f"top_k deve ser um inteiro entre 1 e {MAX_TOP_K}"
+    return None
+
+
 # ============================================================================
 # ROTAS HTML
 # ============================================================================
@@ -66,11 +140,12 @@ def create_note():
         }
     """
     try:
-        data = request.get_json()
+        data = request.get_json(silent=True)
         
         # Validação
-        if not data.get('title') or not data.get('content'):
-            return jsonify({"error": "Título e conteúdo são obrigatórios"}), 400
+        error = _validate_note_payload(data)
+        if error:
+            return jsonify({"error": error}), 400
         
         synapse = get_synapse()
         note = synapse.create_note(
@@ -84,6 +159,8 @@ def create_note():
             "note": note
         }), 201
         
+    except SynapseUnavailableError:
+        return _unavailable_response()
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -102,6 +179,50 @@ def get_notes():
             "count": len(notes)
         })
         
+    except SynapseUnavailableError:
+        return _unavailable_response()
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/api/notes/stream', methods=['GET'])
+def stream_notes():
+    """
+    Lista anotações em streaming, uma por vez, sem montar a lista em memória
+    
+    Query:
+        limit: Número máximo de anotações (padrão 100, até MAX_STREAM_LIMIT)
+        format: "ndjson" (padrão, um JSON por linha) ou "msgpack"
+    """
+    try:
+        limit = request.args.get('limit', 100, type=int)
+        fmt = request.args.get('format', 'ndjson')
+        
+        if fmt not in ('ndjson', 'msgpack'):
+            return jsonify({"error": "Formato deve ser ndjson ou msgpack"}), 400
+        if not 1 <= limit <= MAX_STREAM_LIMIT:
+            return jsonify({"error": f"limit deve estar entre 1 e {MAX_STREAM_LIMIT}"}), 400
+        
+        synapse = get_synapse()
+        
+        # Lê o primeiro registro antes de enviar os cabeçalhos: erros de
+        # conexão ou da consulta ainda viram uma resposta 500 em JSON
+        notes = synapse.iter_all_notes(limit=limit)
+        first = next(notes, None)
+        if first is not None:
+            notes = itertools.chain([first], notes)
+        
+        if fmt == 'msgpack':
+            body = (msgpack.packb(note) for note in notes)
+            mimetype = 'application/x-msgpack'
+        else:
+            body = (json.dumps(note, ensure_ascii=False) + '\n' for note in notes)
+            mimetype = 'application/x-ndjson'
+        
+        return Response(stream_with_context(body), mimetype=mimetype)
+        
+    except SynapseUnavailableError:
+        return _unavailable_response()
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -121,6 +242,8 @@ def get_note(note_id):
         else:
             return jsonify({"error": "Anotação não encontrada"}), 404
             
+    except SynapseUnavailableError:
+        return _unavailable_response()
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -132,11 +255,16 @@ def delete_note(note_id):
         synapse = get_synapse()
         success = synapse.delete_note(note_id)
         
+        if not success:
+            return jsonify({"error": "Falha ao remover a anotação do índice de busca"}), 500
+        
         return jsonify({
             "success": success,
             "message": "Anotação deletada com sucesso"
         })
         
+    except SynapseUnavailableError:
+        return _unavailable_response()
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -153,12 +281,14 @@ def search_notes():
         }
     """
     try:
-        data = request.get_json()
-        query = data.get('query', '')
+        data = request.get_json(silent=True)
         
-        if not query:
-            return jsonify({"error": "Query é obrigatória"}), 400
+        # Validação
+        error = _validate_search_payload(data)
+        if error:
+            return jsonify({"error": error}), 400
         
+        query = data['query']
         top_k = data.get('top_k', 5)
         
         synapse = get_synapse()
@@ -171,6 +301,8 @@ def search_notes():
             "count": len(results)
         })
         
+    except SynapseUnavailableError:
+        return _unavailable_response()
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -187,6 +319,8 @@ def get_stats():
             "stats": stats
         })
         
+    except SynapseUnavailableError:
+        return _unavailable_response()
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -227,7 +361,8 @@ if __name__ == '__main__':
     port = int(os.getenv('PORT', 5000))
     debug = os.getenv('FLASK_DEBUG', 'True').lower() == 'true'
     
-    print(f"\n🌐 Servidor rodando em: http://localhost:{port}")
+    print("\n⚠️  Servidor de desenvolvimento - em produção use: gunicorn app:app")
+    print(f"🌐 Servidor rodando em: http://localhost:{port}")
     print(f"📊 Neo4j Browser: http://localhost:7474")
     print("\n")
     
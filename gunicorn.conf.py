@@ -0,0 +1,53 @@
+"""
+Configuração do Gunicorn - Synapse
+Servidor WSGI de produção (o servidor do Flask é só para desenvolvimento)
+
+Uso:
+    gunicorn app:app
+"""
+
+import multiprocessing
+import os
+
+# Endereço e porta
+bind = f"0.0.0.0:{os.getenv('PORT', 5000)}"
+
+# SO_REUSEPORT: o master abre um único socket que todos os workers herdam,
+# então isso não distribui conexões entre workers; apenas permite que outro
+# processo (ex: um segundo master durante um restart) escute na mesma porta
+reuse_port = True
+
+# Workers com threads: cada worker carrega o modelo de embeddings uma vez
+# e atende várias requisições em paralelo (o batcher agrupa os embeddings)
+workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+worker_class = "gthread"
+threads = int(os.getenv('GUNICORN_THREADS', 8))
+
+# Sem CHROMA_HOST o ChromaDB roda embutido em ./chroma_db, que não suporta
+# vários processos escrevendo no mesmo diretório: força um único worker
+if not os.getenv('CHROMA_HOST'):
+    if workers > 1:
+        print("⚠️  CHROMA_HOST não definido: usando 1 worker (ChromaDB embutido)")
+    workers = 1
+
+# Conexões keep-alive evitam o custo de TIME_WAIT a cada requisição
+keepalive = 30
+
+# Heartbeat dos workers em memória, sem I/O de disco
+if os.path.isdir('/dev/shm'):
+    worker_tmp_dir = '/dev/shm'
+
+# A primeira requisição de cada worker pode incluir o carregamento do modelo
+timeout = 120
+
+
+def post_fork(server, worker):
+    """
+    Divide os núcleos entre os workers antes do torch ser importado
+    
+    Sem isso cada worker usa todos os núcleos no encode e a CPU fica
+    disputada por workers × núcleos threads.
+    """
+    per_worker = str(max(1, multiprocessing.cpu_count() // workers))
+    for var in ('OMP_NUM_THREADS', 'MKL_NUM_THREADS'):
+        os.environ.setdefault(var, per_worker)
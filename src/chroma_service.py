@@ -5,46 +5,178 @@ Gerencia o armazenamento vetorial para busca semântica
 
 import chromadb
 from chromadb.config import Settings
-from typing import List, Dict, Tuple
+from typing import List, Dict, Tuple, Optional
+import ctypes
+import ctypes.util
+import numpy as np
 import os
+import threading
+
+
+# Acima deste número de vetores usa parâmetros HNSW de grande escala
+LARGE_COLLECTION_THRESHOLD = 1_000_000
+
+COLLECTION_NAME = "synapse_notes"
+
+
+def auto_configure_hnsw(count: int) -> Dict:
+    """
+    Retorna os metadados da coleção com parâmetros HNSW para a escala dada
+    
+    Os embeddings são normalizados na geração, então o produto interno
+    equivale ao cosseno e dispensa a normalização por consulta.
+    O ChromaDB lê esses parâmetros só quando a coleção é criada: coleções
+    existentes mantêm os seus até ChromaDBService.reindex().
+    
+    Args:
+        count: Número (atual ou esperado) de vetores na coleção
+        
+    Returns:
+        Dicionário de metadados para a coleção
+    """
+    large = count > LARGE_COLLECTION_THRESHOLD
+    return {
+        "description": "Anotações de estudo do Synapse",
+        "hnsw:space": "ip",
+        "hnsw:M": 32 if large else 24,
+        "hnsw:construction_ef": 128,
+        "hnsw:search_ef": 200 if large else 100,
+        "hnsw:num_threads": os.cpu_count() or 1
+    }
+
+
+def lock_process_memory() -> bool:
+    """
+    Fixa as páginas já mapeadas do processo na RAM (mlockall MCL_CURRENT)
+    
+    Evita que o índice HNSW vá para o swap sob pressão de memória. Exige
+    RLIMIT_MEMLOCK suficiente; sem ele a chamada falha e nada muda.
+    
+    Returns:
+        True se as páginas foram fixadas
+    """
+    MCL_CURRENT = 1
+    libc_name = ctypes.util.find_library("c")
+    if not libc_name:
+        return False
+    libc = ctypes.CDLL(libc_name, use_errno=True)
+    if not hasattr(libc, "mlockall"):
+        return False
+    if libc.mlockall(MCL_CURRENT) != 0:
+        print(f"⚠️  mlockall falhou: {os.strerror(ctypes.get_errno())}")
+        return False
+    return True
 
 
 class ChromaDBService:
     """Serviço para gerenciar embeddings no ChromaDB"""
     
-    def __init__(self, persist_directory: str = "./chroma_db"):
+    def __init__(self, persist_directory: str = "./chroma_db",
+                 host: Optional[str] = None, port: int = 8000,
+                 auth_token: Optional[str] = None, warmup: bool = True,
+                 lock_memory: bool = False):
         """
         Inicializa conexão com ChromaDB
         
+        Com host informado conecta a um servidor Chroma compartilhado, de modo
+        que vários workers usam o mesmo índice HNSW em vez de uma cópia cada.
+        Sem host, mantém o banco embutido no processo (desenvolvimento local).
+        
         Args:
-            persist_directory: Diretório para persistência dos dados
+            persist_directory: Diretório para persistência dos dados (modo local)
+            host: Host do servidor Chroma
+            port: Porta do servidor Chroma
+            auth_token: Token de autenticação do servidor (opcional)
+            warmup: Carrega o índice HNSW em segundo plano ao iniciar
+            lock_memory: Fixa a memória do processo após o aquecimento (modo local)
         """
         self.persist_directory = persist_directory
+        self.host = host
         
-        # Cria diretório se não existir
-        os.makedirs(persist_directory, exist_ok=True)
-        
-        # Inicializa cliente ChromaDB
-        self.client = chromadb.PersistentClient(
-            path=persist_directory,
-            settings=Settings(anonymized_telemetry=False)
-        )
+        if host:
+            # O HttpClient reutiliza uma única sessão HTTP com keep-alive
+            settings = Settings(anonymized_telemetry=False)
+            if auth_token:
+                settings = Settings(
+                    anonymized_telemetry=False,
+                    chroma_client_auth_provider="chromadb.auth.token_authn.TokenAuthClientProvider",
+                    chroma_client_auth_credentials=auth_token
+                )
+            self.client = chromadb.HttpClient(host=host, port=port,
+                                              settings=settings)
+        else:
+            # Cria diretório se não existir
+            os.makedirs(persist_directory, exist_ok=True)
+            
+            # Inicializa cliente ChromaDB
+            self.client = chromadb.PersistentClient(
+                path=persist_directory,
+                settings=Settings(anonymized_telemetry=False)
+            )
         
-        # Cria ou recupera coleção com distância de cosseno
+        # Cria ou recupera coleção com distância de produto interno
+        # (os metadados só são aplicados se a coleção ainda não existir)
         self.collection = self.client.get_or_create_collection(
-            name="synapse_notes",
-            metadata={"description": "Anotações de estudo do Synapse",
-                     "hnsw:space": "cosine"}  # Usa similaridade de cosseno
+            name=COLLECTION_NAME,
+            metadata=auto_configure_hnsw(0)
         )
+        if f"{COLLECTION_NAME}_backup" in self._collection_names():
+            print(f"⚠️  Coleção '{COLLECTION_NAME}_backup' encontrada: uma reindexação "
+                  "foi interrompida e pode conter os vetores. Verifique antes de usar")
+        elif self.needs_reindex():
+            print("⚠️  Coleção do ChromaDB com parâmetros HNSW antigos; "
+                  "execute ChromaDBService.reindex() para aplicar os novos")
+        
+        # Aquece o índice fora do caminho da primeira requisição
+        if warmup:
+            threading.Thread(target=self.warmup, args=(lock_memory,),
+                             name="chroma-warmup", daemon=True).start()
     
-    def add_note(self, note_id: str, embedding: List[float], 
+    def warmup(self, lock_memory: bool = False):
+        """
+        Carrega o índice HNSW na memória para a primeira busca não pagar page faults
+        
+        Args:
+            lock_memory: Fixa a memória do processo ao final (apenas modo local)
+        """
+        try:
+            local = not self.host
+            
+            # Pede ao kernel para ler os arquivos do índice antecipadamente
+            if local and hasattr(os, "posix_fadvise"):
+                for root, _, files in os.walk(self.persist_directory):
+                    for name in files:
+                        if not name.endswith(".bin"):
+                            continue
+                        fd = os.open(os.path.join(root, name), os.O_RDONLY)
+                        try:
+                            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+                        finally:
+                            os.close(fd)
+            
+            # Uma consulta força o carregamento do grafo (dimensão vem do próprio índice)
+            sample = self.collection.get(limit=1, include=["embeddings"])
+            embeddings = sample.get('embeddings')
+            if embeddings is not None and len(embeddings) > 0:
+                dim = len(embeddings[0])
+                self.collection.query(
+                    query_embeddings=[np.zeros(dim, dtype=np.float32)],
+                    n_results=1
+                )
+            
+            if lock_memory and local:
+                lock_process_memory()
+        except Exception as e:
+            print(f"⚠️  Falha ao aquecer o índice do ChromaDB: {e}")
+    
+    def add_note(self, note_id: str, embedding: np.ndarray,
                  metadata: Dict = None) -> bool:
         """
         Adiciona uma anotação ao banco vetorial
         
         Args:
             note_id: ID único da anotação
-            embedding: Vetor representando o conteúdo
+            embedding: Vetor float32 representando o conteúdo
             metadata: Metadados adicionais (título, tags, etc)
             
         Returns:
@@ -61,37 +193,73 @@ class ChromaDBService:
             print(f"❌ Erro ao adicionar no ChromaDB: {e}")
             return False
     
-    def search(self, query_embedding: List[float], 
-               n_results: int = 5) -> Tuple[List[str], List[float]]:
+    def add_notes(self, note_ids: List[str], embeddings: np.ndarray,
+                  metadatas: List[Dict]) -> bool:
+        """
+        Adiciona várias anotações com uma única inserção no índice
+        
+        Args:
+            note_ids: IDs únicos das anotações
+            embeddings: Matriz com um vetor por anotação
+            metadatas: Metadados de cada anotação
+            
+        Returns:
+            True se sucesso
+        """
+        try:
+            self.collection.add(
+                ids=note_ids,
+                embeddings=embeddings,
+                metadatas=metadatas
+            )
+            return True
+        except Exception as e:
+            print(f"❌ Erro ao adicionar no ChromaDB: {e}")
+            return False
+    
+    def search(self, query_embedding: np.ndarray,
+               n_results: int = 5) -> Tuple[List[str], List[float], List[Dict]]:
         """
         Busca anotações similares ao vetor de consulta
         
         Args:
-            query_embedding: Vetor da consulta
+            query_embedding: Vetor float32 da consulta
             n_results: Número de resultados a retornar
             
         Returns:
-            Tupla com (lista de IDs, lista de scores de similaridade)
+            Tupla com (lista de IDs, lista de scores de similaridade,
+            lista de metadados)
         """
-        results = self.collection.query(
-            query_embeddings=[query_embedding],
-            n_results=n_results
-        )
+        try:
+            results = self.collection.query(
+                query_embeddings=[query_embedding],
+                n_results=n_results,
+                include=["metadatas", "distances"]
+            )
+        except RuntimeError as e:
+            # O HNSW falha quando n_results excede os vetores disponíveis
+            if "contiguous 2D array" not in str(e):
+                raise
+            n_results = min(n_results, self.collection.count())
+            if n_results == 0:
+                return [], [], []
+            results = self.collection.query(
+                query_embeddings=[query_embedding],
+                n_results=n_results,
+                include=["metadatas", "distances"]
+            )
         
-        # Extrai IDs e distâncias
+        # Extrai IDs, distâncias e metadados
         ids = results['ids'][0] if results['ids'] else []
         distances = results['distances'][0] if results['distances'] else []
+        metadatas = results['metadatas'][0] if results['metadatas'] else []
         
-        # Com similaridade de cosseno, a distância varia de 0 (idêntico) a 2 (oposto)
-        # Converte para score de 0 a 1
-        similarities = []
-        for dist in distances:
-            # Cosseno: 0 = idêntico, 2 = oposto
-            # Converte para: 1 = idêntico, 0 = oposto
-            similarity = max(0.0, min(1.0, 1.0 - (dist / 2.0)))
-            similarities.append(similarity)
+        # Com vetores normalizados, a distância (ip ou cosseno) é 1 - cos
+        # Converte para score de 0 a 1 (1 = idêntico, 0 = ortogonal ou oposto)
+        d = np.asarray(distances, dtype=np.float32)
+        similarities = np.clip(1.0 - d, 0.0, 1.0).tolist()
         
-        return ids, similarities
+        return ids, similarities, [metadata or {} for metadata in metadatas]
     
     def delete_note(self, note_id: str) -> bool:
         """
@@ -128,19 +296,118 @@ class ChromaDBService:
         """
         try:
             # Deleta a coleção e recria
-            self.client.delete_collection("synapse_notes")
+            self.client.delete_collection(COLLECTION_NAME)
             self.collection = self.client.get_or_create_collection(
-                name="synapse_notes",
-                metadata={"description": "Anotações de estudo do Synapse"}
+                name=COLLECTION_NAME,
+                metadata=auto_configure_hnsw(0)
             )
             return True
         except Exception as e:
             print(f"❌ Erro ao limpar ChromaDB: {e}")
             return False
+    
+    def _collection_names(self) -> set:
+        """Nomes das coleções existentes (list_collections devolve objetos no 0.5.x)"""
+        return {c if isinstance(c, str) else c.name
+                for c in self.client.list_collections()}
+    
+    def needs_reindex(self) -> bool:
+        """
+        Indica se a coleção foi criada com parâmetros HNSW diferentes dos atuais
+        
+        Returns:
+            True se reindex() mudaria espaço, M ou search_ef
+        """
+        current = self.collection.metadata or {}
+        target = auto_configure_hnsw(self.collection.count())
+        return any(current.get(key) != target[key]
+                   for key in ("hnsw:space", "hnsw:M", "hnsw:search_ef"))
+    
+    def reindex(self, batch_size: int = 1000) -> bool:
+        """
+        Recria a coleção com os parâmetros HNSW para o volume atual
+        
+        Copia ids, vetores e metadados para uma coleção nova e só então
+        substitui a antiga: a antiga vira backup, a nova é renomeada para o
+        lugar e o backup só é apagado no fim. Escritas feitas durante a cópia
+        se perdem: execute com a aplicação parada.
+        
+        Args:
+            batch_size: Número de vetores copiados por vez
+            
+        Returns:
+            True se sucesso
+        """
+        temp_name = f"{COLLECTION_NAME}_reindex"
+        backup_name = f"{COLLECTION_NAME}_backup"
+        try:
+            existing = self._collection_names()
+            count = self.collection.count()
+            
+            # Uma troca interrompida deixa os vetores no backup: não sobrescreve
+            if backup_name in existing:
+                print(f"❌ Coleção '{backup_name}' encontrada: uma reindexação anterior "
+                      "não terminou. Restaure-a manualmente antes de reindexar")
+                return False
+            
+            # Sobra de uma cópia interrompida só é descartável se a coleção
+            # principal ainda tem os dados; caso contrário pode ser a única cópia
+            if temp_name in existing:
+                if count == 0:
+                    print(f"❌ '{COLLECTION_NAME}' está vazia e '{temp_name}' existe: "
+                          "ela pode conter os únicos vetores. Reindexação cancelada")
+                    return False
+                self.client.delete_collection(temp_name)
+            
+            print(f"🔄 Reindexando {count} vetores no ChromaDB...")
+            new_collection = self.client.create_collection(
+                name=temp_name,
+                metadata=auto_configure_hnsw(count)
+            )
+            for offset in range(0, count, batch_size):
+                batch = self.collection.get(
+                    limit=batch_size,
+                    offset=offset,
+                    include=["embeddings", "metadatas"]
+                )
+                if batch['ids']:
+                    new_collection.add(
+                        ids=batch['ids'],
+                        embeddings=batch['embeddings'],
+                        metadatas=batch['metadatas']
+                    )
+            
+            if new_collection.count() != count:
+                raise RuntimeError(f"cópia incompleta ({new_collection.count()} de {count})")
+            
+            # Troca por renomeação: a coleção antiga só é apagada depois que
+            # a nova já está no lugar
+            old_collection = self.collection
+            old_collection.modify(name=backup_name)
+            try:
+                new_collection.modify(name=COLLECTION_NAME)
+            except Exception:
+                old_collection.modify(name=COLLECTION_NAME)
+                raise
+            self.collection = new_collection
+            self.client.delete_collection(backup_name)
+            
+            print("✅ Reindexação concluída")
+            return True
+        except Exception as e:
+            print(f"❌ Erro ao reindexar ChromaDB: {e}")
+            return False
 
 
 # Função helper para criar instância do serviço
 def get_chroma_service() -> ChromaDBService:
     """Cria instância do serviço ChromaDB usando variáveis de ambiente"""
     persist_dir = os.getenv('CHROMA_PERSIST_DIR', './chroma_db')
-    return ChromaDBService(persist_directory=persist_dir)
+    host = os.getenv('CHROMA_HOST')
+    port = int(os.getenv('CHROMA_PORT', 8000))
+    auth_token = os.getenv('CHROMA_AUTH_TOKEN')
+    lock_memory = os.getenv('CHROMA_LOCK_MEMORY', 'False').lower() == 'true'
+    
+    return ChromaDBService(persist_directory=persist_dir, host=host,
+                           port=port, auth_token=auth_token,
+                           lock_memory=lock_memory)
@@ -4,39 +4,140 @@ Responsável por converter texto em vetores usando Sentence Transformers
 """
 
 from sentence_transformers import SentenceTransformer
-from typing import List
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import List, Tuple
+import hashlib
 import numpy as np
+import queue
+import threading
+import time
+
+
+class AsyncEmbeddingBatcher:
+    """Agrupa requisições concorrentes de embedding em micro-lotes"""
+    
+    def __init__(self, model: SentenceTransformer, max_batch_size: int = 32,
+                 max_wait: float = 0.005):
+        """
+        Inicia a thread de processamento em segundo plano
+        
+        Args:
+            model: Modelo usado para gerar os embeddings
+            max_batch_size: Tamanho máximo de cada lote
+            max_wait: Tempo máximo (segundos) aguardando novos textos para o lote
+        """
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._queue: "queue.Queue[Tuple[str, Future]]" = queue.Queue()
+        self._worker = threading.Thread(target=self._run, name="embedding-batcher",
+                                        daemon=True)
+        self._worker.start()
+    
+    def submit(self, text: str) -> Future:
+        """
+        Enfileira um texto para o próximo lote
+        
+        Args:
+            text: Texto a ser convertido em vetor
+            
+        Returns:
+            Future que será resolvido com o embedding do texto
+        """
+        future = Future()
+        self._queue.put((text, future))
+        return future
+    
+    def _collect_batch(self) -> List[Tuple[str, Future]]:
+        """Aguarda o primeiro item e drena a fila até o limite do lote ou da janela"""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+    
+    def _run(self):
+        """Loop da thread: codifica cada lote com uma única chamada ao modelo"""
+        while True:
+            batch = self._collect_batch()
+            texts = [text for text, _ in batch]
+            try:
+                embeddings = self.model.encode(texts, batch_size=len(texts),
+                                               convert_to_numpy=True,
+                                               normalize_embeddings=True)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            
+            # Cópias independentes: uma linha em cache não prende o lote inteiro
+            for i, (_, future) in enumerate(batch):
+                future.set_result(embeddings[i].copy())
 
 
 class EmbeddingService:
     """Serviço para geração de embeddings de texto"""
     
-    def __init__(self, model_name: str = 'sentence-transformers/paraphrase-multilingual-mpnet-base-v2'):
+    def __init__(self, model_name: str = 'sentence-transformers/paraphrase-multilingual-mpnet-base-v2',
+                 cache_size: int = 10_000):
         """
         Inicializa o serviço de embeddings
         
         Args:
             model_name: Nome do modelo pré-treinado a ser usado
                        (paraphrase-multilingual-mpnet-base-v2 suporta português)
+            cache_size: Número máximo de textos com embedding em cache (LRU)
         """
         print(f"🔄 Carregando modelo de embeddings: {model_name}")
         self.model = SentenceTransformer(model_name)
+        self.batcher = AsyncEmbeddingBatcher(self.model)
+        
+        # Cache LRU indexado pelo SHA-256 do texto
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[bytes, np.ndarray]" = OrderedDict()
+        self._cache_lock = threading.Lock()
         print("✅ Modelo carregado com sucesso!")
     
-    def generate_embedding(self, text: str) -> List[float]:
+    def generate_embedding(self, text: str) -> np.ndarray:
         """
         Gera embedding para um único texto
         
+        Textos já vistos são servidos do cache pelo hash do conteúdo; os demais
+        vão ao batcher, que os agrupa com requisições concorrentes em uma
+        única chamada ao modelo.
+        
         Args:
             text: Texto a ser convertido em vetor
             
         Returns:
-            Lista de floats representando o vetor do texto
+            Vetor float32 normalizado (norma L2 = 1) e somente leitura
         """
-        embedding = self.model.encode(text, convert_to_numpy=True)
-        return embedding.tolist()
+        key = hashlib.sha256(text.encode("utf-8")).digest()
+        with self._cache_lock:
+            embedding = self._cache.get(key)
+            if embedding is not None:
+                self._cache.move_to_end(key)
+                return embedding
+        
+        embedding = self.batcher.submit(text).result()
+        # O mesmo array é compartilhado entre chamadas
+        embedding.setflags(write=False)
+        
+        with self._cache_lock:
+            self._cache[key] = embedding
+            self._cache.move_to_end(key)
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return embedding
     
-    def generate_embeddings_batch(self, texts: List[str]) -> List[List[float]]:
+    def generate_embeddings_batch(self, texts: List[str]) -> np.ndarray:
         """
         Gera embeddings para múltiplos textos (mais eficiente)
         
@@ -44,36 +145,51 @@ class EmbeddingService:
             texts: Lista de textos
             
         Returns:
-            Lista de vetores
+            Matriz float32 (N x dim) com um vetor normalizado por linha
         """
-        embeddings = self.model.encode(texts, convert_to_numpy=True)
-        return embeddings.tolist()
+        return self.model.encode(texts, convert_to_numpy=True,
+                                 normalize_embeddings=True)
     
-    def calculate_similarity(self, embedding1: List[float], embedding2: List[float]) -> float:
+    def calculate_similarity(self, embedding1: np.ndarray, embedding2: np.ndarray) -> float:
         """
         Calcula similaridade de cosseno entre dois vetores
         
+        Como os embeddings já saem normalizados, o cosseno é o produto interno.
+        
         Args:
-            embedding1: Primeiro vetor
-            embedding2: Segundo vetor
+            embedding1: Primeiro vetor (normalizado)
+            embedding2: Segundo vetor (normalizado)
             
         Returns:
-            Score de similaridade (0 a 1)
+            Score de similaridade (-1 a 1)
+        """
+        return float(embedding1 @ embedding2)
+    
+    @staticmethod
+    def similarities_batch(query: np.ndarray, candidates: np.ndarray) -> np.ndarray:
         """
-        vec1 = np.array(embedding1)
-        vec2 = np.array(embedding2)
+        Calcula o cosseno entre uma consulta e N candidatos em uma única chamada BLAS
         
-        # Similaridade de cosseno
-        similarity = np.dot(vec1, vec2) / (np.linalg.norm(vec1) * np.linalg.norm(vec2))
-        return float(similarity)
+        Args:
+            query: Vetor normalizado (dim)
+            candidates: Matriz de vetores normalizados (N x dim)
+            
+        Returns:
+            Vetor com N scores de similaridade
+        """
+        return candidates @ np.asarray(query, dtype=np.float32)
 
 
 # Singleton para reuso do modelo
 _embedding_service = None
+_embedding_service_lock = threading.Lock()
 
 def get_embedding_service() -> EmbeddingService:
     """Retorna instância singleton do serviço de embeddings"""
     global _embedding_service
     if _embedding_service is None:
-        _embedding_service = EmbeddingService()
+        # Evita que threads concorrentes carreguem o modelo mais de uma vez
+        with _embedding_service_lock:
+            if _embedding_service is None:
+                _embedding_service = EmbeddingService()
     return _embedding_service
@@ -3,16 +3,138 @@ Módulo Neo4j - Synapse
 Gerencia a persistência em grafo das anotações
 """
 
-from neo4j import GraphDatabase
-from typing import Dict, List, Optional
+from neo4j import GraphDatabase, RoutingControl, READ_ACCESS
+from typing import Dict, Iterator, List, Optional
 from datetime import datetime
 import os
 
 
+# Linhas por transação na criação em lote
+BULK_CHUNK_SIZE = 10_000
+
+# Tipos de relação aceitos em create_relation
+RELATION_TYPES = frozenset({"RELATED_TO"})
+
+
+# ============================================================================
+# CONSULTAS CYPHER
+# Texto fixo e parametrizado: o Neo4j reaproveita o plano em cache
+# ============================================================================
+
+# Projeção de uma anotação com as datas já convertidas para string no servidor
+NOTE_PROJECTION = (
+    "{{.*, created_at: toString({0}.created_at), "
+    "updated_at: toString({0}.updated_at)}}"
+)
+
+SCHEMA_QUERIES = (
+    # Constraint de unicidade para o ID
+    """
+    CREATE CONSTRAINT note_id_unique IF NOT EXISTS
+    FOR (n:Note) REQUIRE n.id IS UNIQUE
+    """,
+    # Índice para busca por título
+    """
+    CREATE INDEX note_title_index IF NOT EXISTS
+    FOR (n:Note) ON (n.title)
+    """,
+    # Índice para a listagem ordenada por data (top-K pelo índice)
+    """
+    CREATE INDEX note_created_at IF NOT EXISTS
+    FOR (n:Note) ON (n.created_at)
+    """,
+    # Índice full-text para futura busca textual
+    """
+    CREATE FULLTEXT INDEX note_fts IF NOT EXISTS
+    FOR (n:Note) ON EACH [n.title, n.content]
+    """,
+)
+
+CREATE_NOTE_QUERY = """
+    CREATE (n:Note {
+        id: $note_id,
+        title: $title,
+        content: $content,
+        tags: $tags,
+        created_at: datetime(),
+        updated_at: datetime()
+    })
+    RETURN n """ + NOTE_PROJECTION.format("n") + """ AS n
+"""
+
+CREATE_NOTES_BULK_QUERY = """
+    UNWIND $rows AS row
+    CREATE (n:Note {
+        id: row.id,
+        title: row.title,
+        content: row.content,
+        tags: row.tags,
+        created_at: datetime(),
+        updated_at: datetime()
+    })
+    RETURN n """ + NOTE_PROJECTION.format("n") + """ AS n
+"""
+
+GET_NOTE_QUERY = """
+    MATCH (n:Note {id: $note_id})
+    RETURN n """ + NOTE_PROJECTION.format("n") + """ AS n
+"""
+
+GET_NOTES_BY_IDS_QUERY = """
+    MATCH (n:Note)
+    WHERE n.id IN $note_ids
+    RETURN n """ + NOTE_PROJECTION.format("n") + """ AS n
+"""
+
+# O predicado IS NOT NULL permite ao planner usar note_created_at
+GET_ALL_NOTES_QUERY = """
+    MATCH (n:Note)
+    WHERE n.created_at IS NOT NULL
+    WITH n
+    ORDER BY n.created_at DESC
+    LIMIT $limit
+    RETURN n """ + NOTE_PROJECTION.format("n") + """ AS n
+"""
+
+COUNT_NOTES_QUERY = """
+    MATCH (n:Note)
+    RETURN count(n) AS c
+"""
+
+# O tipo vai como parâmetro (APOC) em vez de interpolado no texto
+CREATE_RELATION_QUERY = """
+    MATCH (a:Note {id: $from_id})
+    MATCH (b:Note {id: $to_id})
+    CALL apoc.merge.relationship(
+        a, $relation_type, {},
+        {created_at: datetime()}, b, {created_at: datetime()}
+    ) YIELD rel
+    RETURN rel
+"""
+
+DELETE_NOTE_QUERY = """
+    MATCH (n:Note {id: $note_id})
+    DETACH DELETE n
+"""
+
+DELETE_NOTES_QUERY = """
+    MATCH (n:Note)
+    WHERE n.id IN $note_ids
+    DETACH DELETE n
+"""
+
+GET_RELATED_NOTES_QUERY = """
+    MATCH (n:Note {id: $note_id})-[r]-(related:Note)
+    RETURN related """ + NOTE_PROJECTION.format("related") + """ AS related,
+           type(r) as relation_type
+"""
+
+
 class Neo4jService:
     """Serviço para gerenciar anotações no Neo4j"""
     
-    def __init__(self, uri: str, user: str, password: str):
+    def __init__(self, uri: str, user: str, password: str,
+                 database: str = "neo4j"):
         """
         Inicializa conexão com Neo4j
         
@@ -20,24 +142,22 @@ class Neo4jService:
             uri: URI de conexão (ex: bolt://localhost:7687)
             user: Usuário do banco
             password: Senha do banco
+            database: Nome do banco (evita a resolução do banco padrão a cada consulta)
         """
-        self.driver = GraphDatabase.driver(uri, auth=(user, password))
+        self.driver = GraphDatabase.driver(
+            uri,
+            auth=(user, password),
+            max_connection_pool_size=50,
+            connection_acquisition_timeout=30
+        )
+        self.database = database
+        
         self._create_constraints()
     
     def _create_constraints(self):
         """Cria constraints e índices necessários"""
-        with self.driver.session() as session:
-            # Cria constraint de unicidade para o ID
-            session.run("""
-                CREATE CONSTRAINT note_id_unique IF NOT EXISTS
-                FOR (n:Note) REQUIRE n.id IS UNIQUE
-            """)
-            
-            # Cria índice para busca por título
-            session.run("""
-                CREATE INDEX note_title_index IF NOT EXISTS
-                FOR (n:Note) ON (n.title)
-            """)
+        for query in SCHEMA_QUERIES:
+            self.driver.execute_query(query, database_=self.database)
     
     def create_note(self, note_id: str, title: str, content: str, 
                     tags: List[str] = None) -> Dict:
@@ -53,22 +173,34 @@ class Neo4jService:
         Returns:
             Dicionário com dados da anotação criada
         """
-        with self.driver.session() as session:
-            result = session.run("""
-                CREATE (n:Note {
-                    id: $note_id,
-                    title: $title,
-                    content: $content,
-                    tags: $tags,
-                    created_at: datetime(),
-                    updated_at: datetime()
-                })
-                RETURN n
-            """, note_id=note_id, title=title, content=content, 
-               tags=tags or [])
+        records, _, _ = self.driver.execute_query(
+            CREATE_NOTE_QUERY, note_id=note_id, title=title, content=content,
+            tags=tags or [], database_=self.database)
+        
+        return self._node_to_dict(records[0]['n'])
+    
+    def create_notes_bulk(self, rows: List[Dict]) -> List[Dict]:
+        """
+        Cria várias anotações com uma consulta UNWIND por transação
+        
+        As linhas são gravadas em transações explícitas de até
+        BULK_CHUNK_SIZE linhas cada.
+        
+        Args:
+            rows: Lista de dicionários com id, title, content e tags
             
-            record = result.single()
-            return self._node_to_dict(record['n'])
+        Returns:
+            Lista com os dados das anotações criadas
+        """
+        notes = []
+        with self.driver.session(database=self.database) as session:
+            for start in range(0, len(rows), BULK_CHUNK_SIZE):
+                chunk = rows[start:start + BULK_CHUNK_SIZE]
+                with session.begin_transaction() as tx:
+                    result = tx.run(CREATE_NOTES_BULK_QUERY, rows=chunk)
+                    notes.extend(self._node_to_dict(record['n']) for record in result)
+                    tx.commit()
+        return notes
     
     def get_note(self, note_id: str) -> Optional[Dict]:
         """
@@ -80,18 +212,15 @@ class Neo4jService:
         Returns:
             Dicionário com dados da anotação ou None
         """
-        with self.driver.session() as session:
-            result = session.run("""
-                MATCH (n:Note {id: $note_id})
-                RETURN n
-            """, note_id=note_id)
-            
-            record = result.single()
-            if record:
-                return self._node_to_dict(record['n'])
-            return None
+        records, _, _ = self.driver.execute_query(
+            GET_NOTE_QUERY, note_id=note_id, database_=self.database,
+            routing_=RoutingControl.READ)
+        
+        if records:
+            return self._node_to_dict(records[0]['n'])
+        return None
     
-    def get_notes_by_ids(self, note_ids: List[str]) -> List[Dict]:
+    def get_notes_by_ids(self, note_ids: List[str]) -> Dict[str, Dict]:
         """
         Recupera múltiplas anotações por IDs
         
@@ -99,16 +228,17 @@ class Neo4jService:
             note_ids: Lista de IDs
             
         Returns:
-            Lista de anotações
+            Dicionário {id: anotação}; o Neo4j não preserva a ordem de note_ids
         """
-        with self.driver.session() as session:
-            result = session.run("""
-                MATCH (n:Note)
-                WHERE n.id IN $note_ids
-                RETURN n
-            """, note_ids=note_ids)
-            
-            return [self._node_to_dict(record['n']) for record in result]
+        records, _, _ = self.driver.execute_query(
+            GET_NOTES_BY_IDS_QUERY, note_ids=note_ids, database_=self.database,
+            routing_=RoutingControl.READ)
+        
+        notes = {}
+        for record in records:
+            note = self._node_to_dict(record['n'])
+            notes[note['id']] = note
+        return notes
     
     def get_all_notes(self, limit: int = 100) -> List[Dict]:
         """
@@ -120,15 +250,42 @@ class Neo4jService:
         Returns:
             Lista de anotações
         """
-        with self.driver.session() as session:
-            result = session.run("""
-                MATCH (n:Note)
-                RETURN n
-                ORDER BY n.created_at DESC
-                LIMIT $limit
-            """, limit=limit)
+        records, _, _ = self.driver.execute_query(
+            GET_ALL_NOTES_QUERY, limit=limit, database_=self.database,
+            routing_=RoutingControl.READ)
+        
+        return [self._node_to_dict(record['n']) for record in records]
+    
+    def iter_all_notes(self, limit: int = 100) -> Iterator[Dict]:
+        """
+        Percorre as anotações sob demanda, sem materializar a lista
+        
+        A sessão fica aberta enquanto o gerador é consumido.
+        
+        Args:
+            limit: Número máximo de resultados
             
-            return [self._node_to_dict(record['n']) for record in result]
+        Yields:
+            Uma anotação por vez, na mesma ordem de get_all_notes
+        """
+        with self.driver.session(database=self.database,
+                                 default_access_mode=READ_ACCESS) as session:
+            result = session.run(GET_ALL_NOTES_QUERY, limit=limit)
+            for record in result:
+                yield self._node_to_dict(record['n'])
+    
+    def count_notes(self) -> int:
+        """
+        Conta as anotações usando a contagem do índice de label
+        
+        Returns:
+            Número de anotações
+        """
+        records, _, _ = self.driver.execute_query(
+            COUNT_NOTES_QUERY, database_=self.database,
+            routing_=RoutingControl.READ)
+        
+        return records[0]['c']
     
     def create_relation(self, from_note_id: str, to_note_id: str, 
                        relation_type: str = "RELATED_TO") -> bool:
@@ -138,19 +295,18 @@ class Neo4jService:
         Args:
             from_note_id: ID da anotação de origem
             to_note_id: ID da anotação de destino
-            relation_type: Tipo de relação
+            relation_type: Tipo de relação (um de RELATION_TYPES)
             
         Returns:
             True se sucesso
         """
-        with self.driver.session() as session:
-            session.run(f"""
-                MATCH (a:Note {{id: $from_id}})
-                MATCH (b:Note {{id: $to_id}})
-                MERGE (a)-[r:{relation_type}]->(b)
-                SET r.created_at = datetime()
-            """, from_id=from_note_id, to_id=to_note_id)
-            return True
+        if relation_type not in RELATION_TYPES:
+            raise ValueError(f"Tipo de relação inválido: {relation_type}")
+        
+        self.driver.execute_query(
+            CREATE_RELATION_QUERY, from_id=from_note_id, to_id=to_note_id,
+            relation_type=relation_type, database_=self.database)
+        return True
     
     def delete_note(self, note_id: str) -> bool:
         """
@@ -162,12 +318,23 @@ class Neo4jService:
         Returns:
             True se sucesso
         """
-        with self.driver.session() as session:
-            session.run("""
-                MATCH (n:Note {id: $note_id})
-                DETACH DELETE n
-            """, note_id=note_id)
-            return True
+        self.driver.execute_query(
+            DELETE_NOTE_QUERY, note_id=note_id, database_=self.database)
+        return True
+    
+    def delete_notes(self, note_ids: List[str]) -> bool:
+        """
+        Deleta várias anotações e suas relações em uma única consulta
+        
+        Args:
+            note_ids: Lista de IDs (IDs inexistentes são ignorados)
+            
+        Returns:
+            True se sucesso
+        """
+        self.driver.execute_query(
+            DELETE_NOTES_QUERY, note_ids=note_ids, database_=self.database)
+        return True
     
     def get_related_notes(self, note_id: str) -> List[Dict]:
         """
@@ -179,28 +346,20 @@ class Neo4jService:
         Returns:
             Lista de anotações relacionadas
         """
-        with self.driver.session() as session:
-            result = session.run("""
-                MATCH (n:Note {id: $note_id})-[r]-(related:Note)
-                RETURN related, type(r) as relation_type
-            """, note_id=note_id)
-            
-            related = []
-            for record in result:
-                note = self._node_to_dict(record['related'])
-                note['relation_type'] = record['relation_type']
-                related.append(note)
-            return related
+        records, _, _ = self.driver.execute_query(
+            GET_RELATED_NOTES_QUERY, note_id=note_id, database_=self.database,
+            routing_=RoutingControl.READ)
+        
+        related = []
+        for record in records:
+            note = self._node_to_dict(record['related'])
+            note['relation_type'] = record['relation_type']
+            related.append(note)
+        return related
     
     def _node_to_dict(self, node) -> Dict:
-        """Converte nó do Neo4j para dicionário Python"""
-        data = dict(node)
-        # Converte datetime para string
-        if 'created_at' in data:
-            data['created_at'] = str(data['created_at'])
-        if 'updated_at' in data:
-            data['updated_at'] = str(data['updated_at'])
-        return data
+        """Converte a projeção da anotação (datas já em string) para dicionário Python"""
+        return dict(node)
     
     def close(self):
         """Fecha conexão com o banco"""
@@ -213,5 +372,6 @@ def get_neo4j_service() -> Neo4jService:
     uri = os.getenv('NEO4J_URI', 'bolt://localhost:7687')
     user = os.getenv('NEO4J_USER', 'neo4j')
     password = os.getenv('NEO4J_PASSWORD', 'synapse123')
+    database = os.getenv('NEO4J_DATABASE', 'neo4j')
     
-    return Neo4jService(uri, user, password)
+    return Neo4jService(uri, user, password, database)
@@ -3,13 +3,193 @@ Módulo Principal - Synapse
 Orquestra a interação entre Neo4j, ChromaDB e Embeddings
 """
 
-from typing import List, Dict, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional
+import json
+import threading
+import time
 import uuid
-from .embeddings import get_embedding_service
+import numpy as np
+from .embeddings import EmbeddingService, get_embedding_service
 from .neo4j_service import Neo4jService
 from .chroma_service import ChromaDBService
 
 
+# Cache TTL para contagens usadas pelo painel (/api/stats)
+STATS_TTL_SECONDS = 30
+_stats_cache: Dict[str, tuple] = {}
+
+
+def _note_to_metadata(note: Dict) -> Dict:
+    """Monta os metadados do ChromaDB com tudo que a busca precisa exibir"""
+    return {
+        "title": note['title'],
+        "content": note['content'],
+        "tags": json.dumps(note.get('tags') or [], ensure_ascii=False),
+        "created_at": note['created_at'],
+        "updated_at": note['updated_at']
+    }
+
+
+def _parse_metadata_tags(raw: str) -> List[str]:
+    """Lê as tags salvas como lista JSON (ou no formato antigo, separadas por vírgula)"""
+    if not raw:
+        return []
+    try:
+        tags = json.loads(raw)
+    except ValueError:
+        return raw.split(",")
+    return tags if isinstance(tags, list) else raw.split(",")
+
+
+def _metadata_to_note(note_id: str, metadata: Dict) -> Dict:
+    """Reconstrói a anotação a partir dos metadados do ChromaDB"""
+    return {
+        "id": note_id,
+        "title": metadata['title'],
+        "content": metadata['content'],
+        "tags": _parse_metadata_tags(metadata.get('tags')),
+        "created_at": metadata.get('created_at'),
+        "updated_at": metadata.get('updated_at')
+    }
+
+
+class SemanticQueryCache:
+    """
+    Cache LRU de buscas indexado pela similaridade do embedding da consulta
+    
+    clear() só vale para o processo atual; com vários workers, uma escrita feita
+    em outro worker só aparece aqui quando a entrada expira. Por isso o TTL é
+    curto (segundos): limita por quanto tempo uma busca pode ficar desatualizada.
+    """
+    
+    def __init__(self, threshold: float = 0.95, max_size: int = 512,
+                 ttl: float = 30):
+        """
+        Inicializa o cache vazio
+        
+        Args:
+            threshold: Similaridade mínima para considerar duas consultas iguais
+            max_size: Número máximo de consultas armazenadas
+            ttl: Tempo de vida (segundos) de cada entrada
+        """
+        self.threshold = threshold
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # Incrementada a cada clear(); resultados calculados antes não são guardados
+        self._generation = 0
+        # (N, dim) float16 normalizado: metade da memória, sem perda relevante no cosseno
+        self._vectors: Optional[np.ndarray] = None
+        self._top_ks: List[int] = []
+        self._results: List[List[Dict]] = []
+        self._created_at: List[float] = []
+        self._last_used: List[float] = []
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, query_embedding: np.ndarray, top_k: int) -> Optional[List[Dict]]:
+        """
+        Procura uma consulta equivalente já respondida
+        
+        Args:
+            query_embedding: Vetor normalizado da consulta
+            top_k: Número de resultados pedidos
+            
+        Returns:
+            Cópia dos resultados em cache ou None
+        """
+        with self._lock:
+            self._expire(time.time())
+            if self._vectors is not None and len(self._top_ks) > 0:
+                sims = EmbeddingService.similarities_batch(query_embedding, self._vectors)
+                idx = int(np.argmax(sims))
+                if sims[idx] >= self.threshold and self._top_ks[idx] >= top_k:
+                    self._last_used[idx] = time.time()
+                    self.hits += 1
+                    return [dict(note) for note in self._results[idx][:top_k]]
+            self.misses += 1
+            return None
+    
+    @property
+    def generation(self) -> int:
+        """Geração atual; deve ser lida antes de consultar o banco"""
+        with self._lock:
+            return self._generation
+    
+    def put(self, query_embedding: np.ndarray, top_k: int, results: List[Dict],
+            generation: int):
+        """
+        Armazena o resultado de uma consulta, removendo a entrada LRU se cheio
+        
+        Args:
+            query_embedding: Vetor normalizado da consulta
+            top_k: Número de resultados pedidos
+            results: Resultados retornados pela busca
+            generation: Valor de generation lido antes da busca; se houve um
+                        clear() desde então, o resultado pode estar
+                        desatualizado e é descartado
+        """
+        now = time.time()
+        vector = np.asarray(query_embedding, dtype=np.float16).reshape(1, -1)
+        with self._lock:
+            if generation != self._generation:
+                return
+            
+            if len(self._top_ks) >= self.max_size:
+                self._remove(int(np.argmin(self._last_used)))
+            
+            if self._vectors is None or len(self._top_ks) == 0:
+                self._vectors = vector
+            else:
+                self._vectors = np.vstack([self._vectors, vector])
+            self._top_ks.append(top_k)
+            self._results.append([dict(note) for note in results])
+            self._created_at.append(now)
+            self._last_used.append(now)
+    
+    def clear(self):
+        """Descarta todas as entradas (ex: após criar ou deletar anotações)"""
+        with self._lock:
+            self._generation += 1
+            self._vectors = None
+            self._top_ks = []
+            self._results = []
+            self._created_at = []
+            self._last_used = []
+    
+    def stats(self) -> Dict:
+        """
+        Retorna contadores de uso do cache
+        
+        Returns:
+            Dicionário com acertos, falhas, taxa de acerto e tamanho
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "size": len(self._top_ks)
+            }
+    
+    def _expire(self, now: float):
+        """Remove entradas mais antigas que o TTL"""
+        expired = [i for i, created in enumerate(self._created_at)
+                   if now - created > self.ttl]
+        for idx in reversed(expired):
+            self._remove(idx)
+    
+    def _remove(self, idx: int):
+        """Remove a entrada na posição idx de todas as estruturas paralelas"""
+        self._vectors = np.delete(self._vectors, idx, axis=0)
+        del self._top_ks[idx]
+        del self._results[idx]
+        del self._created_at[idx]
+        del self._last_used[idx]
+
+
 class SynapseCore:
     """Classe principal que orquestra todas as operações do Synapse"""
     
@@ -24,6 +204,14 @@ class SynapseCore:
         self.neo4j = neo4j_service
         self.chroma = chroma_service
         self.embeddings = get_embedding_service()
+        self.query_cache = SemanticQueryCache()
+        # Executa escritas no Neo4j em paralelo à geração de embeddings
+        self._write_pool = ThreadPoolExecutor(max_workers=8,
+                                              thread_name_prefix="synapse-write")
+    
+    def warmup(self):
+        """Executa um embedding descartável para aquecer o modelo e as bibliotecas numéricas"""
+        self.embeddings.generate_embedding("warmup")
     
     def create_note(self, title: str, content: str, tags: List[str] = None) -> Dict:
         """
@@ -31,9 +219,8 @@ class SynapseCore:
         
         Fluxo:
         1. Gera ID único
-        2. Cria embedding do conteúdo
-        3. Salva no Neo4j (grafo)
-        4. Salva no ChromaDB (vetor)
+        2. Salva no Neo4j (grafo) em paralelo à geração do embedding
+        3. Salva no ChromaDB (vetor) quando ambos terminam
         
         Args:
             title: Título da anotação
@@ -49,39 +236,105 @@ class SynapseCore:
         # Cria texto completo para embedding (título + conteúdo)
         full_text = f"{title}. {content}"
         
-        # Gera embedding
-        print("🔄 Gerando embedding...")
-        embedding = self.embeddings.generate_embedding(full_text)
-        
-        # Salva no Neo4j
+        # Salva no Neo4j em segundo plano (não depende do embedding)
         print("🔄 Salvando no Neo4j...")
-        note = self.neo4j.create_note(
+        neo_future = self._write_pool.submit(
+            self.neo4j.create_note,
             note_id=note_id,
             title=title,
             content=content,
             tags=tags
         )
         
-        # Salva no ChromaDB
+        # Gera embedding enquanto o Neo4j grava
+        print("🔄 Gerando embedding...")
+        try:
+            embedding = self.embeddings.generate_embedding(full_text)
+        except Exception:
+            # Sem vetor a anotação nunca seria encontrada na busca: desfaz no Neo4j
+            try:
+                neo_future.result()
+                self.neo4j.delete_note(note_id)
+            except Exception as e:
+                print(f"❌ Erro ao desfazer anotação {note_id} no Neo4j: {e}")
+            raise
+        note = neo_future.result()
+        
+        # Salva no ChromaDB com os dados exibidos na busca
         print("🔄 Salvando no ChromaDB...")
-        metadata = {
-            "title": title,
-            "tags": ",".join(tags) if tags else ""
-        }
-        self.chroma.add_note(note_id, embedding, metadata)
+        self.chroma.add_note(note_id, embedding, _note_to_metadata(note))
+        
+        # Buscas anteriores não incluem a nova anotação
+        self.query_cache.clear()
+        _stats_cache.clear()
         
         print(f"✅ Anotação criada: {note_id}")
         return note
     
+    def create_notes_bulk(self, items: List[Dict]) -> List[Dict]:
+        """
+        Cria várias anotações de uma vez (ex: importação)
+        
+        Fluxo:
+        1. Gera todos os embeddings em um único lote
+        2. Salva no Neo4j com uma consulta UNWIND
+        3. Salva no ChromaDB com uma única inserção
+        
+        Args:
+            items: Lista de dicionários com title, content e tags (opcional)
+            
+        Returns:
+            Lista com os dados das anotações criadas
+        """
+        if not items:
+            return []
+        
+        rows = [{
+            "id": str(uuid.uuid4()),
+            "title": item['title'],
+            "content": item['content'],
+            "tags": item.get('tags') or []
+        } for item in items]
+        
+        print(f"🔄 Gerando {len(rows)} embeddings...")
+        embeddings = self.embeddings.generate_embeddings_batch(
+            [f"{row['title']}. {row['content']}" for row in rows]
+        )
+        
+        note_ids = [row['id'] for row in rows]
+        try:
+            print("🔄 Salvando no Neo4j...")
+            notes = self.neo4j.create_notes_bulk(rows)
+            
+            print("🔄 Salvando no ChromaDB...")
+            notes_by_id = {note['id']: note for note in notes}
+            metadatas = [_note_to_metadata(notes_by_id[row['id']]) for row in rows]
+            if not self.chroma.add_notes(note_ids, embeddings, metadatas):
+                raise RuntimeError("Falha ao adicionar as anotações no ChromaDB")
+        except Exception:
+            # Lotes já confirmados no Neo4j ficariam sem vetor: desfaz todos
+            try:
+                self.neo4j.delete_notes(note_ids)
+            except Exception as e:
+                print(f"❌ Erro ao desfazer anotações em lote no Neo4j: {e}")
+            raise
+        
+        self.query_cache.clear()
+        _stats_cache.clear()
+        
+        print(f"✅ {len(notes)} anotações criadas")
+        return notes
+    
     def search_notes(self, query: str, top_k: int = 5) -> List[Dict]:
         """
         Busca anotações semanticamente similares à consulta
         
         Fluxo:
         1. Gera embedding da consulta
-        2. Busca no ChromaDB os vetores mais similares
-        3. Recupera dados completos do Neo4j
-        4. Retorna resultados ordenados por relevância
+        2. Retorna do cache se uma consulta equivalente já foi respondida
+        3. Busca no ChromaDB os vetores mais similares (com os dados das notas)
+        4. Recupera do Neo4j apenas notas antigas sem dados nos metadados
+        5. Retorna resultados ordenados por relevância
         
         Args:
             query: Texto da consulta
@@ -95,23 +348,46 @@ class SynapseCore:
         # Gera embedding da consulta
         query_embedding = self.embeddings.generate_embedding(query)
         
+        # Consulta o cache semântico
+        cached = self.query_cache.get(query_embedding, top_k)
+        if cached is not None:
+            print(f"✅ Encontradas {len(cached)} anotações (cache)")
+            return cached
+        
+        # Lida antes da busca: uma escrita concorrente invalida este resultado
+        cache_generation = self.query_cache.generation
+        
         # Busca no ChromaDB
-        note_ids, similarities = self.chroma.search(query_embedding, n_results=top_k)
+        note_ids, similarities, metadatas = self.chroma.search(query_embedding,
+                                                               n_results=top_k)
         
         if not note_ids:
             print("❌ Nenhum resultado encontrado")
             return []
         
-        # Recupera dados completos do Neo4j
-        notes = self.neo4j.get_notes_by_ids(note_ids)
+        # Notas criadas antes dos metadados completos ainda vêm do Neo4j
+        notes_by_id = {}
+        missing_ids = []
+        for note_id, metadata in zip(note_ids, metadatas):
+            if 'content' in metadata:
+                notes_by_id[note_id] = _metadata_to_note(note_id, metadata)
+            else:
+                missing_ids.append(note_id)
+        if missing_ids:
+            notes_by_id.update(self.neo4j.get_notes_by_ids(missing_ids))
         
-        # Adiciona score de similaridade e ordena
+        # Adiciona score de similaridade mantendo a ordem do ChromaDB
         results = []
-        for note, similarity in zip(notes, similarities):
+        for note_id, similarity in zip(note_ids, similarities):
+            note = notes_by_id.get(note_id)
+            if note is None:
+                continue
             note['similarity_score'] = similarity
             note['similarity_percentage'] = f"{similarity * 100:.1f}%"
             results.append(note)
         
+        self.query_cache.put(query_embedding, top_k, results, cache_generation)
+        
         print(f"✅ Encontradas {len(results)} anotações")
         return results
     
@@ -139,6 +415,18 @@ class SynapseCore:
         """
         return self.neo4j.get_all_notes(limit)
     
+    def iter_all_notes(self, limit: int = 100) -> Iterator[Dict]:
+        """
+        Percorre as anotações sob demanda (para respostas em streaming)
+        
+        Args:
+            limit: Número máximo de resultados
+            
+        Returns:
+            Gerador de anotações
+        """
+        return self.neo4j.iter_all_notes(limit)
+    
     def delete_note(self, note_id: str) -> bool:
         """
         Deleta uma anotação de ambos os bancos
@@ -147,15 +435,23 @@ class SynapseCore:
             note_id: ID da anotação
             
         Returns:
-            True se sucesso
+            True se sucesso; False se o ChromaDB falhou (nada é removido do
+            Neo4j, então a operação pode ser repetida)
         """
         print(f"🗑️  Deletando anotação: {note_id}")
         
+        # Deleta do ChromaDB primeiro: a busca é servida só pelos metadados
+        # do ChromaDB, então um vetor que sobrasse continuaria aparecendo
+        if not self.chroma.delete_note(note_id):
+            print(f"❌ Anotação {note_id} não removida do ChromaDB; Neo4j mantido")
+            return False
+        
         # Deleta do Neo4j
         self.neo4j.delete_note(note_id)
         
-        # Deleta do ChromaDB
-        self.chroma.delete_note(note_id)
+        # Buscas anteriores podem conter a anotação removida
+        self.query_cache.clear()
+        _stats_cache.clear()
         
         print("✅ Anotação deletada")
         return True
@@ -193,7 +489,19 @@ class SynapseCore:
             Dicionário com estatísticas
         """
         return {
-            "total_notes_neo4j": len(self.neo4j.get_all_notes(limit=10000)),
+            "total_notes_neo4j": self._count_notes_cached(),
             "total_notes_chroma": self.chroma.get_count(),
-            "embedding_model": "paraphrase-multilingual-mpnet-base-v2"
+            "embedding_model": "paraphrase-multilingual-mpnet-base-v2",
+            "query_cache": self.query_cache.stats()
         }
+    
+    def _count_notes_cached(self) -> int:
+        """Conta as anotações no Neo4j reaproveitando o valor por STATS_TTL_SECONDS"""
+        now = time.time()
+        cached = _stats_cache.get("total_notes_neo4j")
+        if cached is not None and now - cached[1] < STATS_TTL_SECONDS:
+            return cached[0]
+        
+        count = self.neo4j.count_notes()
+        _stats_cache["total_notes_neo4j"] = (count, now)
+        return count